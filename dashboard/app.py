@@ -14,18 +14,54 @@ st.set_page_config(
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@st.cache_resource
+def get_supabase():
+    return create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    )
+
+
+supabase = get_supabase()
 
 # -------------------------------------------------
-# Load assets (FIXED COLUMN NAME)
+# Cached loaders (avoid re-downloading tables on every rerun)
 # -------------------------------------------------
-assets_res = supabase.table("assets").select(
-    "asset_id, name, ticker"
-).order("name").execute()
+@st.cache_data(ttl=300)
+def load_assets():
+    res = supabase.table("assets").select(
+        "asset_id, name, ticker"
+    ).order("name").execute()
+    return pd.DataFrame(res.data)
+
+
+@st.cache_data(ttl=300)
+def load_latest_metrics(asset_id):
+    res = supabase.table("daily_metrics") \
+        .select("*") \
+        .eq("asset_id", asset_id) \
+        .order("created_at", desc=True) \
+        .limit(1) \
+        .execute()
+    return res.data
+
+
+@st.cache_data(ttl=300)
+def load_news(asset_id, limit=50):
+    res = supabase.table("news") \
+        .select("title, url, source, published_at") \
+        .eq("asset_id", asset_id) \
+        .order("published_at", desc=True) \
+        .limit(limit) \
+        .execute()
+    return pd.DataFrame(res.data)
 
-assets_df = pd.DataFrame(assets_res.data)
+
+# -------------------------------------------------
+# Load assets (FIXED COLUMN NAME)
+# -------------------------------------------------
+assets_df = load_assets()
 
 if assets_df.empty:
     st.error("No assets found.")
@@ -34,15 +70,15 @@ if assets_df.empty:
 # -------------------------------------------------
 # Asset selector (robust)
 # -------------------------------------------------
+asset_labels = dict(zip(
+    assets_df["asset_id"],
+    assets_df["name"] + " (" + assets_df["ticker"] + ")"
+))
+
 selected_asset_id = st.selectbox(
     "Select an asset",
-    options=assets_df["asset_id"].tolist(),
-    format_func=lambda x: (
-        assets_df.loc[assets_df["asset_id"] == x, "name"].values[0]
-        + " ("
-        + assets_df.loc[assets_df["asset_id"] == x, "ticker"].values[0]
-        + ")"
-    )
+    options=list(asset_labels),
+    format_func=asset_labels.get
 )
 
 asset_row = assets_df[assets_df["asset_id"] == selected_asset_id].iloc[0]
@@ -60,15 +96,10 @@ st.markdown(
 # -------------------------------------------------
 # Daily metrics
 # -------------------------------------------------
-metrics_res = supabase.table("daily_metrics") \
-    .select("*") \
-    .eq("asset_id", selected_asset_id) \
-    .order("created_at", desc=True) \
-    .limit(1) \
-    .execute()
+metrics_data = load_latest_metrics(selected_asset_id)
 
-if metrics_res.data:
-    m = metrics_res.data[0]
+if metrics_data:
+    m = metrics_data[0]
 
     col1, col2, col3, col4 = st.columns(4)
 
@@ -84,13 +115,7 @@ else:
 # -------------------------------------------------
 st.markdown("### Latest news")
 
-news_res = supabase.table("news") \
-    .select("title, url, source, published_at") \
-    .eq("asset_id", selected_asset_id) \
-    .order("published_at", desc=True) \
-    .execute()
-
-news_df = pd.DataFrame(news_res.data)
+news_df = load_news(selected_asset_id)
 
 if news_df.empty:
     st.info("No news available.")
@@ -101,22 +126,17 @@ else:
     visible_news = news_df.head(MAX_VISIBLE)
     extra_news = news_df.iloc[MAX_VISIBLE:]
 
-    for _, row in visible_news.iterrows():
-        st.markdown(
-            f"- **[{row['title']}]({row['url']})**  \n"
+    def news_markdown(rows):
+        return "\n".join(
+            f"- **[{row.title}]({row.url})**  \n"
             f"<span style='color:#6f6f6f; font-size:0.85em'>"
-            f"{row['source']} · {row['published_at']}"
-            f"</span>",
-            unsafe_allow_html=True
+            f"{row.source} · {row.published_at}"
+            f"</span>"
+            for row in rows.itertuples()
         )
 
+    st.markdown(news_markdown(visible_news), unsafe_allow_html=True)
+
     if not extra_news.empty:
         with st.expander(f"Show {len(extra_news)} more articles"):
-            for _, row in extra_news.iterrows():
-                st.markdown(
-                    f"- **[{row['title']}]({row['url']})**  \n"
-                    f"<span style='color:#6f6f6f; font-size:0.85em'>"
-                    f"{row['source']} · {row['published_at']}"
-                    f"</span>",
-                    unsafe_allow_html=True
-                )
+            st.markdown(news_markdown(extra_news), unsafe_allow_html=True)
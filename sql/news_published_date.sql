@@ -0,0 +1,12 @@
+-- Stored, indexed date for news rows so daily grouping and date-range
+-- filters hit a typed column instead of slicing ISO strings.
+-- v_daily_metrics groups on this column; apply this migration first.
+--
+-- The "at time zone 'utc'" step keeps the expression immutable when
+-- published_at is timestamptz (a bare ::date cast would be rejected).
+
+alter table news
+    add column if not exists published_date date
+    generated always as ((published_at at time zone 'utc')::date) stored;
+
+create index if not exists news_published_date_idx on news (published_date);
@@ -0,0 +1,5 @@
+-- The pipeline deduplicates articles with
+--   upsert(..., on_conflict="url", ignore_duplicates=True)
+-- which needs a unique constraint on news.url to resolve conflicts.
+
+create unique index if not exists news_url_uk on news (url);
@@ -0,0 +1,19 @@
+-- Daily sentiment metrics aggregated next to the data instead of in Python.
+-- Apply news_published_date.sql first, then this, in the Supabase SQL
+-- editor; refresh after each ingest with:
+--   refresh materialized view concurrently v_daily_metrics;
+
+create materialized view if not exists v_daily_metrics as
+select
+    n.asset_id,
+    n.published_date                as metric_date,
+    avg(nlp.sentiment_score)        as avg_sentiment,
+    stddev_pop(nlp.sentiment_score) as sentiment_std,
+    count(*)                        as news_volume
+from news n
+join news_nlp nlp using (news_id)
+group by 1, 2;
+
+-- Required for "refresh ... concurrently".
+create unique index if not exists v_daily_metrics_pk
+    on v_daily_metrics (asset_id, metric_date);
@@ -1,10 +1,21 @@
+import asyncio
+import calendar
+import hashlib
+import json
 import os
 import feedparser
 from datetime import datetime, date, timedelta
 from urllib.parse import quote_plus
-from collections import defaultdict
-
-from tqdm import tqdm
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+import httpx
+import numpy as np
+import pandas as pd
+import torch
+from tqdm.asyncio import tqdm_asyncio
 from supabase import create_client
 from transformers import pipeline
 
@@ -23,41 +34,185 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 # =============================
 LOOKBACK_DAYS = 7
 SENTIMENT_MODEL = "ProsusAI/finbert"
+UPSERT_CHUNK_SIZE = 500
+
+
+def chunked(rows, size=UPSERT_CHUNK_SIZE):
+    """Yield successive batches of rows, bounding each request payload."""
+    it = iter(rows)
+    return iter(lambda: list(islice(it, size)), [])
+
+
+def parallel_upsert(table, rows, max_workers=8, **kwargs):
+    """Upsert rows in chunks, dispatching the batches concurrently."""
+    batches = list(chunked(rows))
+    if not batches:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(
+            lambda batch: supabase.table(table).upsert(
+                batch, **kwargs
+            ).execute(),
+            batches
+        ))
+
+
+def load_json_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_json_cache(path, cache):
+    with open(path, "w") as f:
+        json.dump(cache, f)
 
 
 # =============================
 # LOAD FINBERT (LOCAL)
 # =============================
-sentiment_pipeline = pipeline(
-    "sentiment-analysis",
-    model=SENTIMENT_MODEL,
-    tokenizer=SENTIMENT_MODEL
-)
+ONNX_INT8_DIR = ".finbert_onnx_int8"
+
+
+@lru_cache(maxsize=1)
+def load_sentiment_pipeline():
+    """Load FinBERT, preferring a dynamic-int8 ONNX export when optimum is installed."""
+    try:
+        from optimum.onnxruntime import (
+            ORTModelForSequenceClassification,
+            ORTQuantizer
+        )
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+    except ImportError:
+        return pipeline(
+            "sentiment-analysis",
+            model=SENTIMENT_MODEL,
+            tokenizer=SENTIMENT_MODEL,
+            device=0 if torch.cuda.is_available() else -1
+        )
+
+    if not os.path.isdir(ONNX_INT8_DIR):
+        model = ORTModelForSequenceClassification.from_pretrained(
+            SENTIMENT_MODEL, export=True
+        )
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantizer.quantize(
+            save_dir=ONNX_INT8_DIR,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(
+                is_static=False
+            )
+        )
+
+    return pipeline(
+        "sentiment-analysis",
+        model=ORTModelForSequenceClassification.from_pretrained(ONNX_INT8_DIR),
+        tokenizer=AutoTokenizer.from_pretrained(SENTIMENT_MODEL)
+    )
 
 
 # =============================
 # 1. LOAD ASSETS
 # =============================
-assets = supabase.table("assets").select("*").execute().data
+assets = supabase.table("assets").select(
+    "asset_id, name, ticker"
+).execute().data
 print(f"{len(assets)} assets found")
 
 
 # =============================
 # 2. FETCH NEWS (GOOGLE NEWS)
 # =============================
-news_rows = []
-seen_urls = set()
+FETCH_CONCURRENCY = 16
+FEED_CACHE_PATH = ".feed_cache.json"
+NLP_CACHE_PATH = ".nlp_cache.json"
 
-print("Fetching news...")
 
-for asset in tqdm(assets, desc="Fetching news"):
+def google_news_rss(asset):
     query = quote_plus(f"{asset['ticker']} stock")
-    rss_url = (
+    return (
         "https://news.google.com/rss/search"
         f"?q={query}&hl=en-CA&gl=CA&ceid=CA:en"
     )
 
-    feed = feedparser.parse(rss_url)
+
+async def fetch_feed(client, sem, asset, cache):
+    url = google_news_rss(asset)
+
+    headers = {}
+    cached = cache.get(url, {})
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("modified"):
+        headers["If-Modified-Since"] = cached["modified"]
+
+    try:
+        async with sem:
+            resp = await client.get(url, timeout=10, headers=headers)
+    except httpx.HTTPError as e:
+        print(f"Fetch error for {asset['ticker']}:", e)
+        return asset, None
+
+    if resp.status_code == 304:
+        return asset, None
+
+    if resp.status_code != 200:
+        print(f"Fetch error for {asset['ticker']}: HTTP {resp.status_code}")
+        return asset, None
+
+    cache[url] = {
+        "etag": resp.headers.get("ETag"),
+        "modified": resp.headers.get("Last-Modified")
+    }
+    return asset, feedparser.parse(resp.content)
+
+
+async def fetch_all_feeds(assets):
+    cache = load_json_cache(FEED_CACHE_PATH)
+    sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    limits = httpx.Limits(
+        max_keepalive_connections=FETCH_CONCURRENCY,
+        max_connections=FETCH_CONCURRENCY * 2
+    )
+
+    async with httpx.AsyncClient(
+        http2=True, follow_redirects=True, limits=limits
+    ) as client:
+        feeds = await tqdm_asyncio.gather(
+            *[fetch_feed(client, sem, asset, cache) for asset in assets],
+            desc="Fetching news"
+        )
+
+    save_json_cache(FEED_CACHE_PATH, cache)
+    return feeds
+
+
+news_rows = []
+
+# One round-trip for recent URLs so already-stored articles are
+# filtered locally instead of being shipped to the upsert.
+seen_urls = {
+    r["url"]
+    for r in supabase.table("news")
+    .select("url")
+    .gte(
+        "published_at",
+        (date.today() - timedelta(days=LOOKBACK_DAYS)).isoformat()
+    )
+    .execute().data
+}
+
+print("Fetching news...")
+
+feeds = asyncio.run(fetch_all_feeds(assets))
+
+for asset, feed in feeds:
+    if feed is None:
+        continue
 
     for entry in feed.entries:
         if not hasattr(entry, "published_parsed"):
@@ -69,8 +224,8 @@ for asset in tqdm(assets, desc="Fetching news"):
 
         seen_urls.add(url)
 
-        published_at = datetime(
-            *entry.published_parsed[:6]
+        published_at = datetime.utcfromtimestamp(
+            calendar.timegm(entry.published_parsed)
         ).isoformat()
 
         news_rows.append({
@@ -84,27 +239,61 @@ for asset in tqdm(assets, desc="Fetching news"):
 
 print(f"{len(news_rows)} articles fetched")
 
-if news_rows:
-    supabase.table("news").insert(news_rows).execute()
+parallel_upsert("news", news_rows, on_conflict="url", ignore_duplicates=True)
 
 
 # =============================
 # 3. NLP — FINBERT SENTIMENT
 # =============================
-news_items = supabase.table("news").select("*").execute().data
+news_items = supabase.table("news") \
+    .select("news_id, content, news_nlp!left(news_id)") \
+    .is_("news_nlp", "null") \
+    .execute().data
 nlp_rows = []
 
 print("Running sentiment analysis...")
 
-for item in tqdm(news_items, desc="Running sentiment"):
+nlp_cache = load_json_cache(NLP_CACHE_PATH)
+
+texts = [item["content"] for item in news_items]
+keys = [
+    hashlib.sha1(text.strip().lower().encode()).hexdigest()
+    for text in texts
+]
+
+pending = {
+    key: text for key, text in zip(keys, texts)
+    if key not in nlp_cache
+}
+
+if pending:
     try:
-        result = sentiment_pipeline(item["content"][:512])[0]
+        results = load_sentiment_pipeline()(
+            list(pending.values()),
+            batch_size=32,
+            truncation=True,
+            max_length=512,
+            padding=True
+        )
     except Exception as e:
         print("Sentiment error:", e)
+        results = []
+
+    for key, result in zip(pending, results):
+        nlp_cache[key] = {
+            "label": result["label"].lower(),
+            "score": result["score"]
+        }
+
+    save_json_cache(NLP_CACHE_PATH, nlp_cache)
+
+for item, key in zip(news_items, keys):
+    cached = nlp_cache.get(key)
+    if cached is None:
         continue
 
-    label = result["label"].lower()
-    score = result["score"]
+    label = cached["label"]
+    score = cached["score"]
 
     sentiment_score = (
         score if label == "positive"
@@ -120,58 +309,64 @@ for item in tqdm(news_items, desc="Running sentiment"):
         "model_name": SENTIMENT_MODEL
     })
 
-if nlp_rows:
-    supabase.table("news_nlp").upsert(
-        nlp_rows, on_conflict="news_id"
-    ).execute()
+parallel_upsert("news_nlp", nlp_rows, on_conflict="news_id")
 
 
 # =============================
 # 4. DAILY METRICS (MEILLEUR SIGNAL)
 # =============================
-metrics = defaultdict(list)
+PAGE_SIZE = 1000
 
-rows = supabase.table("news_nlp") \
-    .select("sentiment_score, news:news_id(asset_id, published_at)") \
-    .execute().data
+rows = []
+last_id = 0
 
-for row in rows:
-    asset_id = row["news"]["asset_id"]
-    d = row["news"]["published_at"][:10]
-    metrics[(asset_id, d)].append(row["sentiment_score"])
+while True:
+    page = supabase.table("news_nlp") \
+        .select("news_id, sentiment_score, news:news_id!inner(asset_id, published_at)") \
+        .gt("news_id", last_id) \
+        .order("news_id") \
+        .limit(PAGE_SIZE) \
+        .execute().data
 
-metric_rows = []
+    if not page:
+        break
 
-for (asset_id, d), scores in metrics.items():
-    avg = sum(scores) / len(scores)
-    std = (sum((s - avg) ** 2 for s in scores) / len(scores)) ** 0.5
-    volume = len(scores)
-
-    if volume < 3:
-        signal = "low_coverage"
-    elif std > 0.35:
-        signal = "high_uncertainty"
-    elif avg > 0.15:
-        signal = "positive_momentum"
-    elif avg < -0.15:
-        signal = "negative_pressure"
-    else:
-        signal = "neutral"
-
-    metric_rows.append({
-        "asset_id": asset_id,
-        "metric_date": d,
-        "avg_sentiment": avg,
-        "news_volume": volume,
-        "sentiment_std": std,
-        "signal": signal
-    })
+    rows.extend(page)
+    last_id = page[-1]["news_id"]
+
+scores_df = pd.json_normalize(rows)
 
-if metric_rows:
-    supabase.table("daily_metrics").upsert(
-        metric_rows,
-        on_conflict="asset_id,metric_date"
-    ).execute()
+metric_rows = []
+
+if not scores_df.empty:
+    scores_df = scores_df.rename(columns={"news.asset_id": "asset_id"})
+    scores_df["metric_date"] = scores_df["news.published_at"].str.slice(0, 10)
+
+    agg = scores_df.groupby(["asset_id", "metric_date"])["sentiment_score"] \
+        .agg(
+            avg_sentiment="mean",
+            sentiment_std=lambda s: s.std(ddof=0),
+            news_volume="count"
+        ) \
+        .reset_index()
+
+    conditions = [
+        agg["news_volume"] < 3,
+        agg["sentiment_std"] > 0.35,
+        agg["avg_sentiment"] > 0.15,
+        agg["avg_sentiment"] < -0.15
+    ]
+    signals = [
+        "low_coverage",
+        "high_uncertainty",
+        "positive_momentum",
+        "negative_pressure"
+    ]
+    agg["signal"] = np.select(conditions, signals, default="neutral")
+
+    metric_rows = agg.to_dict("records")
+
+parallel_upsert("daily_metrics", metric_rows, on_conflict="asset_id,metric_date")
 
 
 # =============================
@@ -181,23 +376,28 @@ today = date.today()
 start_date = today - timedelta(days=LOOKBACK_DAYS)
 
 metrics = supabase.table("daily_metrics") \
-    .select("*") \
+    .select("asset_id, avg_sentiment, news_volume, signal") \
     .gte("metric_date", start_date.isoformat()) \
     .execute().data
 
 print("Generating market briefs...")
 
+metrics_by_asset = defaultdict(list)
+for m in metrics:
+    metrics_by_asset[m["asset_id"]].append(m)
+
+brief_rows = []
+
 for asset in assets:
-    rows = [m for m in metrics if m["asset_id"] == asset["asset_id"]]
+    rows = metrics_by_asset.get(asset["asset_id"], [])
     if not rows:
         continue
 
     avg_sent = sum(r["avg_sentiment"] for r in rows) / len(rows)
     total_news = sum(r["news_volume"] for r in rows)
-    dominant_signal = max(
-        set(r["signal"] for r in rows),
-        key=lambda s: sum(x["signal"] == s for x in rows)
-    )
+    dominant_signal = Counter(
+        r["signal"] for r in rows
+    ).most_common(1)[0][0]
 
     content = (
         f"Over the past {LOOKBACK_DAYS} days, {asset['name']} ({asset['ticker']}) "
@@ -208,12 +408,15 @@ for asset in assets:
         f"and news coverage."
     )
 
-    supabase.table("market_briefs").insert({
+    brief_rows.append({
         "period_start": start_date.isoformat(),
         "period_end": today.isoformat(),
         "scope": asset["ticker"],
         "content": content,
         "model_name": "rule_based_v1"
-    }).execute()
+    })
+
+for batch in chunked(brief_rows):
+    supabase.table("market_briefs").insert(batch).execute()
 
 print("Pipeline completed successfully.")